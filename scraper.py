@@ -29,17 +29,28 @@ CLI and Library to fetch ROM info and media from online databases
 from __future__ import annotations
 
 import argparse
+import collections
+import concurrent.futures
+import functools
+import io
 import itertools
-import json
 import logging
+import mmap
 import os
 import pathlib
+import re
+import shutil
+import sqlite3
 import sys
+import threading
+import time
 import tomllib  # in stdlib since Python 3.11
 import typing as t
 import zlib
 
+import orjson
 import requests
+import requests.adapters
 import xxhash
 
 if t.TYPE_CHECKING:
@@ -50,6 +61,9 @@ __version__ = "0.1"
 __title__ = "Rom Media Scraper"
 
 TIMEOUT = 60
+JOBS = 4
+HASH_JOBS = min(8, os.cpu_count() or 1)  # More concurrent readers than that only thrash the disk
+MEDIA_JOBS = 8  # Concurrent media downloads per game
 LAYOUT = "batocera"
 
 CONFIG_PATH = pathlib.Path(__file__).with_name("config.toml")  # TODO: use platformdirs
@@ -62,6 +76,11 @@ type JsonList = list[Json]
 type JsonDictSet = dict[str, Json | set[str] | set[int]]  # set intentionally only as root value
 
 
+class Readable(t.Protocol):
+    """Binary stream that can be read in chunks, such as a file or a raw HTTP response"""
+    def read(self, size: int = -1, /) -> bytes: ...
+
+
 class ApiData(t.TypedDict):
     response: JsonDict
 
@@ -135,30 +154,116 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         type=pathlib.Path,
         help="Cache directory [Default: %(default)s]"
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        default=JOBS,
+        type=int,
+        help="Number of ROMs to scrape concurrently [Default: %(default)s]"
+    )
+    parser.add_argument(
+        "--trust-names",
+        default=False,
+        action="store_true",
+        help="Take CRC32 from ROM file names tagged with it, such as 'Game (USA) [1A2B3C4D].sfc',"
+        " instead of hashing the files."
+    )
 #    group = parser.add_mutually_exclusive_group()
 #    group.add_argument("--list-media-types", default=False, action="store_true", help="List supported media types")
     parser.add_argument(nargs="*", dest="paths", metavar="ROM_PATH", help="ROM files or folders")
 
     args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error(f"argument -j/--jobs: must be at least 1: {args.jobs}")
     args.debug = (args.loglevel == logging.DEBUG)
-    logging.basicConfig(
-        level=args.loglevel,
-        format="[%(asctime)s %(levelname)-5s] %(module)-4s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
     return args
 
 
+class LogFormatter(logging.Formatter):
+    """Formatter that renders the record time at most once per second, when datefmt is set"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._asctime: tuple[int, str] = (-1, "")
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        # Only valid as long as datefmt has no sub-second fields.
+        # Default format appends milliseconds, so it can't be cached
+        if datefmt is None:
+            return super().formatTime(record, datefmt)
+        second, asctime = self._asctime
+        if int(record.created) != second:
+            asctime = super().formatTime(record, datefmt)
+            self._asctime = (int(record.created), asctime)
+        return asctime
+
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """Configure root logger, once"""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    if level > logging.DEBUG:
+        # Skip gathering record fields that are not used
+        logging.logThreads = False
+        logging.logProcesses = False
+        logging.logMultiprocessing = False
+    handler = logging.StreamHandler()
+    handler.setFormatter(LogFormatter(
+        fmt="[%(asctime)s %(levelname)-5s] %(module)-4s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    ))
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
 def read_config(path: os.PathLike) -> dict:
-    return tomllib.loads(pathlib.Path(path).read_text())
+    path = pathlib.Path(path)
+    return _read_config(path, path.stat().st_mtime_ns)
 
 
-def pretty(obj: object, indent=2, sort_keys=False) -> str:
-    return json.dumps(obj, separators=(',', ':'), default=str, sort_keys=sort_keys, indent=indent)
+@functools.lru_cache(maxsize=4)
+def _read_config(path: pathlib.Path, _mtime_ns: int) -> dict:
+    # mtime is part of the cache key, so an edited config is re-read
+    with path.open(mode="rb") as fd:
+        return tomllib.load(fd)
 
 
-def hashobj(obj: object) -> str:
-    return xxhash.xxh3_128_hexdigest(pretty(obj, indent=1, sort_keys=True))
+def pretty(obj: object, indent=True, sort_keys=False) -> str:
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2  # the only indentation orjson supports
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, default=str, option=option).decode()
+
+
+def cache_key(origin: str, name: str, params: dict | None = None) -> str:
+    """Hash identifying a resource, suitable for cache file names"""
+    items = tuple(sorted((params or {}).items()))
+    try:
+        return _cache_key(origin, name, items)
+    except TypeError:  # unhashable param values, can't be memoized
+        return _cache_key.__wrapped__(origin, name, items)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cache_key(origin: str, name: str, items: tuple[tuple[str, t.Any], ...]) -> str:
+    # Hand-rolled canonical form: for small flat dicts of params, way cheaper than JSON
+    text = "\0".join(itertools.chain((origin, name), (f"{k}={v}" for k, v in items)))
+    # 64-bit is plenty for cache keys: collisions are unlikely well below 2**32 entries.
+    return f"{xxhash.xxh3_64_intdigest(text.encode()):016x}"
+
+
+def intern_dict[K, V](data: dict[K, V], maxlen: int = 32) -> dict[K, V]:
+    """Copy of a dict with its short str keys and values interned.
+
+    Repeated strings, such as region codes and media types, then share a single
+    object, saving memory and allowing dict lookups to match by identity.
+    """
+    def intern(obj):
+        return sys.intern(obj) if isinstance(obj, str) and len(obj) < maxlen else obj
+    return {intern(k): intern(v) for k, v in data.items()}
 
 
 def unique[T:"abc.Hashable"](iterable: abc.Iterable[T], discard_falsy: bool = True) -> abc.Iterator[T]:
@@ -167,23 +272,68 @@ def unique[T:"abc.Hashable"](iterable: abc.Iterable[T], discard_falsy: bool = Tr
     # Alternative: unique_everseen() from itertools recipes or more-itertools package
     # (faster and allow un-hashable (i.e. mutable) elements)
     # https://stackoverflow.com/a/17016257/624066
-    yield from dict.fromkeys(filter(None, iterable) if discard_falsy else iterable)
-
-
-def iter_files(paths: abc.Iterable[os.PathLike], yield_dirs=False) -> abc.Iterator[pathlib.Path]:
+    # Lazy: elements are yielded as found, so early-exiting callers don't consume it all
+    seen: dict[T, None] = {}
+    for item in iterable:
+        if (discard_falsy and not item) or item in seen:
+            continue
+        seen[item] = None
+        yield item
+
+
+def unique_list[T:"abc.Hashable"](iterable: abc.Iterable[T], discard_falsy: bool = True) -> list[T]:
+    """Unique elements as a list, preserving order. Like list(unique()), but all at once"""
+    return list(dict.fromkeys(filter(None, iterable) if discard_falsy else iterable))
+
+
+def iter_files(
+    paths: abc.Iterable[os.PathLike],
+    yield_dirs=False,
+    suffixes: abc.Container[str] | None = None,
+) -> abc.Iterator[pathlib.Path]:
+    """Yield files in paths, recursively. Files found in dirs can be filtered by (lowercase) suffixes"""
+    for parent, files in iter_dirs(paths, suffixes=suffixes):
+        if yield_dirs:
+            yield parent
+        yield from files
+
+
+def iter_dirs(
+    paths: abc.Iterable[os.PathLike],
+    suffixes: abc.Container[str] | None = None,
+) -> abc.Iterator[tuple[pathlib.Path, list[pathlib.Path]]]:
+    """Yield (directory, files) for each directory with files in paths, recursively.
+
+    Like iter_files(), but grouped so callers know which entries are directories without stat() calls.
+    """
     for item in paths:
         path = pathlib.Path(item)
         if path.is_file():
-            if yield_dirs:
-                yield path.parent
-            yield path
+            yield path.parent, [path]
         elif path.is_dir():
+            # Using scandir() directly: entry types come from the directory listing itself,
+            # no stat() calls, and Path objects are only built for what is yielded.
             # TODO: handle symlink infinite loops
-            for dirpath, _, filenames in path.walk(follow_symlinks=True):
-                if yield_dirs and filenames:
-                    yield dirpath
-                for filename in sorted(filenames):
-                    yield dirpath / filename
+            stack: list[str] = [os.fspath(path)]
+            while stack:
+                dirpath = stack.pop()
+                try:
+                    with os.scandir(dirpath) as it:
+                        entries = sorted(it, key=lambda _: _.name)
+                except OSError:
+                    continue
+                subdirs: list[str] = []
+                filenames: list[str] = []
+                for entry in entries:
+                    if entry.is_dir():  # follows symlinks
+                        subdirs.append(entry.path)
+                    elif suffixes is None or os.path.splitext(entry.name)[1].lower() in suffixes:
+                        filenames.append(entry.name)
+                stack.extend(reversed(subdirs))
+                if not filenames:
+                    continue
+                parent = pathlib.Path(dirpath)
+                yield parent, [parent / filename for filename in filenames]
 
 
 def csv2iter[T](
@@ -197,6 +347,71 @@ def csv2iter[T](
     return (itemtype(_.strip()) for _ in text.split(sep))
 
 
+def write_stream(path: os.PathLike, stream: Readable, bufsize: int = 2**20) -> None:
+    """Copy a readable binary stream to a file, never holding all data in memory.
+
+    The file is written atomically: data goes to a temporary file in the same
+    directory, renamed to path only when complete, so an interrupted download
+    never leaves a truncated file behind.
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per thread, so concurrent downloads of the same file don't clash
+    tmp = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        # No fsync(): cached data can always be downloaded again
+        with tmp.open(mode="wb") as fd:
+            shutil.copyfileobj(stream, fd, bufsize)
+        tmp.replace(path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_blob(blobdir: os.PathLike, stream: Readable, bufsize: int = 2**20) -> pathlib.Path:
+    """Store a binary stream in blobdir, content-addressed by its digest, and return the blob path.
+
+    Identical contents share a single blob, which is only written once.
+    """
+    blobdir = pathlib.Path(blobdir)
+    blobdir.mkdir(parents=True, exist_ok=True)
+    # Digest is only known when done, so stream to a temporary file first
+    tmp = blobdir / f".{os.getpid()}-{threading.get_ident()}.tmp"
+    hasher = xxhash.xxh3_128()
+    try:
+        with tmp.open(mode="wb") as fd:
+            while chunk := stream.read(bufsize):
+                hasher.update(chunk)
+                fd.write(chunk)
+        digest = hasher.hexdigest()
+        blob = blobdir / digest[:2] / digest[2:]
+        if blob.exists():
+            tmp.unlink()
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            tmp.replace(blob)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return blob
+
+
+def link_blob(blob: os.PathLike, path: os.PathLike) -> None:
+    """Atomically make path a hard link to blob, or a copy of it if links are not supported"""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+    try:
+        try:
+            os.link(blob, tmp)
+        except OSError:  # Filesystem without hard links, such as FAT
+            shutil.copyfile(blob, tmp)
+        tmp.replace(path)
+    finally:
+        # Renaming over a link to the same file is a no-op that leaves tmp behind
+        tmp.unlink(missing_ok=True)
+
+
 class ScraperError(Exception):
     """Base class for custom exceptions with a few extras on top of Exception.
 
@@ -227,8 +442,63 @@ class ScraperResponseError(ScraperError):
         super().__init__(msg, *args, errno=self.res.status_code, err=err)
 
 
+class RateLimiter:
+    """Thread-safe limiter of concurrent requests and of requests per minute.
+
+    Use as a context manager around each request: entering blocks until both
+    a thread slot is free and the per-minute quota allows another request.
+    Limits can be changed at any time with update(), e.g. from server replies.
+    """
+
+    def __init__(self, threads: int = 1, per_minute: int = 0):
+        self.threads: int = threads
+        self.per_minute: int = per_minute  # 0: unlimited
+        self._active: int = 0
+        self._starts: collections.deque[float] = collections.deque()
+        self._cond = threading.Condition()
+
+    def update(self, threads: int = 0, per_minute: int = 0) -> None:
+        with self._cond:
+            self.threads = threads or self.threads
+            self.per_minute = per_minute or self.per_minute
+            self._cond.notify_all()
+
+    def _delay(self) -> float:
+        """Seconds to wait until the per-minute quota allows a new request"""
+        if not self.per_minute:
+            return 0
+        now = time.monotonic()
+        while self._starts and now - self._starts[0] >= 60:
+            self._starts.popleft()
+        if len(self._starts) < self.per_minute:
+            return 0
+        return 60 - (now - self._starts[0])
+
+    def __enter__(self) -> t.Self:
+        with self._cond:
+            while True:
+                if self._active < self.threads:
+                    if (delay := self._delay()) <= 0:
+                        break
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+            self._active += 1
+            if self.per_minute:
+                self._starts.append(time.monotonic())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+
 class CachedResource:
     TEXT_TYPES = {"json", "xml", "txt", "html"}
+    BLOBS_DIR = "blobs"  # Binary data, content-addressed and hard-linked from its cache path
+    # Created for every API call, so keep them lean and precompute all derived attributes
+    __slots__ = ("stem", "type", "root", "index", "name", "relpath", "path", "is_text", "is_json")
 
     def __init__(
         self,
@@ -236,58 +506,156 @@ class CachedResource:
         name: str,
         params: dict | None = None,
         filetype: str = "",
-        rootdir: os.PathLike | None = None
+        rootdir: os.PathLike | None = None,
+        index: set[str] | None = None,
     ):
-        self.stem = pathlib.Path(hashobj((origin, name, params)))
-        self.type = filetype.lstrip(".").lower()
-        self.root = None if rootdir is None else pathlib.Path(rootdir)
-
-    @property
-    def name(self) -> pathlib.Path:
-        return self.stem.with_suffix(f".{self.type}") if self.type else self.stem
-
-    @property
-    def path(self) -> pathlib.Path | None:
-        if self.root is None:
-            return None
-        return self.root / self.name
-
-    @property
-    def is_text(self) -> bool:
-        return self.type in self.TEXT_TYPES
-
-    @property
-    def is_json(self) -> bool:
-        return self.type == "json"
+        self.stem: str = cache_key(origin, name, params)
+        self.type: str = filetype.lstrip(".").lower()
+        self.root: pathlib.Path | None = None if rootdir is None else pathlib.Path(rootdir)
+        # Relative paths of existing cache files, if known, to skip filesystem lookups on misses
+        self.index: set[str] | None = index
+        self.name: str = f"{self.stem}.{self.type}" if self.type else self.stem
+        # Sharded in subdirs by the first 2 digits of the stem, like git objects:
+        # keep directories small, so lookups don't degrade with size
+        self.relpath: str = f"{self.stem[:2]}/{self.name[2:]}"
+        self.path: pathlib.Path | None = None if self.root is None else self.root / self.relpath
+        self.is_text: bool = self.type in self.TEXT_TYPES
+        self.is_json: bool = self.type == "json"
+
+    @classmethod
+    def scan(cls, rootdir: StrPath) -> set[str]:
+        """Relative paths of all cache files in rootdir"""
+        index: set[str] = set()
+        try:
+            shards = os.scandir(rootdir)
+        except FileNotFoundError:
+            return index
+        with shards:
+            for shard in shards:
+                if len(shard.name) != 2 or not shard.is_dir():  # Not a shard, such as blobs
+                    continue
+                with os.scandir(shard.path) as entries:
+                    index.update(f"{shard.name}/{entry.name}" for entry in entries)
+        return index
 
     def read(self) -> Json | str | bytes | None:
         if (path := self.path) is None:
             return None
+        if self.index is not None and self.relpath not in self.index:
+            return None
         try:
-            data = path.read_text() if self.is_text else path.read_bytes()
-        except FileNotFoundError:
+            if self.is_json:
+                data = orjson.loads(path.read_bytes())
+            else:
+                data = path.read_text() if self.is_text else path.read_bytes()
+        except FileNotFoundError:  # Only when removed behind the index's back
+            if self.index is not None:
+                self.index.discard(self.relpath)
             return None
         log.debug("Data retrieved from cache: %s", path)
-        return json.loads(data) if self.is_json else data
+        return data
 
-    def write(self, data: str | bytes) -> None:
+    def write(self, data: Json | str | bytes) -> None:
         if (path := self.path) is None:
             return
         log.debug("Write data to cache: %s", path)
         path.parent.mkdir(parents=True, exist_ok=True)
         if self.is_json:
-            path.write_text(pretty(t.cast(str, data)))
+            # Compact: cache files are machine-read only
+            path.write_bytes(orjson.dumps(data))
         elif self.is_text:
             path.write_text(t.cast(str, data))
         else:
-            path.write_bytes(t.cast(bytes, data))
+            # Same media is often shared by several games: store its content only once
+            digest = xxhash.xxh3_128_hexdigest(t.cast(bytes, data))
+            blob = t.cast(pathlib.Path, self.root) / self.BLOBS_DIR / digest[:2] / digest[2:]
+            if not blob.exists():
+                write_stream(blob, io.BytesIO(t.cast(bytes, data)))
+            link_blob(blob, path)
+        if self.index is not None:
+            self.index.add(self.relpath)
+
+    def write_stream(self, stream: Readable) -> None:
+        if (path := self.path) is None:
+            return
+        log.debug("Stream data to cache: %s", path)
+        if self.is_text:
+            write_stream(path, stream)
+        else:
+            blob = write_blob(t.cast(pathlib.Path, self.root) / self.BLOBS_DIR, stream)
+            link_blob(blob, path)
+        if self.index is not None:
+            self.index.add(self.relpath)
 
+    def exists(self) -> bool:
+        if (path := self.path) is None:
+            return False
+        if self.index is not None:
+            return self.relpath in self.index
+        return path.exists()
 
-class Rom:
-    CHUNK_SIZE = 64 * 2**10
+
+class CrcCache:
+    """Persistent cache of ROM CRC32 values, invalidated by changes in size or mtime.
+
+    Errors are never fatal: a failed lookup is a cache miss, a failed store is skipped.
+    """
 
     def __init__(self, path: os.PathLike):
         self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared by hashing threads, serialized by our own lock.
+        # Autocommit: no write transaction is held open, locking out other processes
+        # sharing the cache. With WAL and synchronous=NORMAL commits don't fsync.
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS crc32"
+                " (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, crc TEXT)"
+            )
+
+    def get(self, path: pathlib.Path, stat: os.stat_result) -> str:
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT crc FROM crc32 WHERE path = ? AND mtime = ? AND size = ?",
+                    (str(path), stat.st_mtime_ns, stat.st_size),
+                ).fetchone()
+        except sqlite3.Error as e:
+            log.warning("Could not read CRC32 cache for %s: %s", path, e)
+            return ""
+        return row[0] if row else ""
+
+    def set(self, path: pathlib.Path, stat: os.stat_result, crc: str) -> None:
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO crc32 VALUES (?, ?, ?, ?)",
+                    (str(path), stat.st_mtime_ns, stat.st_size, crc),
+                )
+        except sqlite3.Error as e:
+            log.warning("Could not write CRC32 cache for %s: %s", path, e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class Rom:
+    MMAP_MAX_SIZE = 2**30  # Larger files are hashed in chunks, not to map them whole
+    BUFFER_SIZE = 4 * 2**20
+    # "[1A2B3C4D]" or "(1A2B3C4D)". At least one A-F digit, so dates like "(20001231)" are
+    # not taken as CRCs: all-decimal CRCs are rare, and those ROMs are just hashed instead.
+    CRC_TAG = re.compile(r"\[(?=\d*[A-Fa-f])([0-9A-Fa-f]{8})\]|\((?=\d*[A-Fa-f])([0-9A-Fa-f]{8})\)")
+
+    def __init__(self, path: os.PathLike, trust_name: bool = False, crc_cache: CrcCache | None = None):
+        self.path = path if isinstance(path, pathlib.Path) else pathlib.Path(path)
+        self.trust_name = trust_name  # Take CRC32 from a name tag, if any
+        self.crc_cache = crc_cache
+        self._size = -1
         self._crc32 = ""
 
     @property
@@ -296,18 +664,45 @@ class Rom:
 
     @property
     def size(self) -> int:
-        return self.path.stat().st_size
+        if self._size < 0:
+            self._size = self.path.stat().st_size
+        return self._size
 
     @property
     def crc32(self) -> str:
+        """CRC32 of the ROM contents, as used by ROM databases"""
         if not self._crc32:
-            crc = 0
-            with self.path.open(mode="rb") as fd:
-                while chunk := fd.read(self.CHUNK_SIZE):
-                    crc = zlib.crc32(chunk, crc)
-            self._crc32 = f"{crc & 0xFFFFFFFF:08X}"
+            if self.trust_name and (match := self.CRC_TAG.search(self.path.stem)):
+                self._crc32 = (match[1] or match[2]).upper()
+            elif self.crc_cache is None:
+                self._hash_crc32()
+            else:
+                path, stat = self.path.resolve(), self.path.stat()
+                if not (crc := self.crc_cache.get(path, stat)):
+                    self._hash_crc32()
+                    self.crc_cache.set(path, stat, crc := self._crc32)
+                self._crc32 = crc
         return self._crc32
 
+    def _hash_crc32(self) -> None:
+        with self.path.open(mode="rb", buffering=0) as fd:
+            size = os.fstat(fd.fileno()).st_size
+            if 0 < size < self.MMAP_MAX_SIZE:
+                # Map the file and hash it in a single call: no Python-level read loop,
+                # the kernel pages data in as zlib consumes it, with the GIL released.
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if hasattr(mmap, "MADV_SEQUENTIAL"):
+                        mm.madvise(mmap.MADV_SEQUENTIAL)
+                    crc = zlib.crc32(mm)
+            else:
+                # Huge (or empty) files: read into a reusable buffer, bounding memory use
+                crc = 0
+                buffer = bytearray(self.BUFFER_SIZE)
+                view = memoryview(buffer)
+                while size := fd.readinto(buffer):
+                    crc = zlib.crc32(view[:size], crc)
+        self._crc32 = f"{crc & 0xFFFFFFFF:08X}"
+
     def __repr__(self) -> str:
         return f"<ROM {str(self.path)!r}, {self.size} bytes, CRC32={self.crc32!r}>"
 
@@ -324,13 +719,15 @@ class System:
         self.id: int = int(data["id"])
         self.name: str = data["noms"]["nom_eu"]  # the only "nom_*" surely present in all systems
         # FIXME: handle "pc(a|b),dos(c|d)" cases for extensions
-        self.suffixes: set[str] = set(f".{_}" for _ in csv2iter(data.get("extensions", "")))
+        # Plain split()s, as this runs for every system on each run
+        self.suffixes: frozenset[str] = frozenset(
+            f".{_}" for _ in filter(None, (_.strip().lower() for _ in data.get("extensions", "").split(",")))
+        )
         self.manufacturer: str = data.get("compagnie", "")
-        self.paths: set[str] = set(
-            _.lower() for _ in
-            set(itertools.chain.from_iterable(csv2iter(_) for _ in data["noms"].values()))
+        self.paths: frozenset[str] = frozenset(
+            filter(None, (_.strip().lower() for names in data["noms"].values() for _ in names.split(",")))
         )
-        self.names: tuple[str, ...] = tuple(unique(data["noms"].get(f"nom_{_}", "") for _ in ("eu", "us", "jp")))
+        self.names: tuple[str, ...] = tuple(unique_list(data["noms"].get(f"nom_{_}", "") for _ in ("eu", "us", "jp")))
 
     def __str__(self):
         if self.manufacturer:
@@ -353,7 +750,14 @@ class ScreenScraper:
     API_DEVELOPER = "xxx"
     API_PASSWORD = "yyy"
     API_SOFTWARE = f"{__title__} v{__version__}"
+    API_ENDPOINTS = ("jeuInfos.php", "jeuRecherche.php", "mediasJeuListe.php", "systemesListe.php")
+    _ENDPOINT_URLS = dict(zip(API_ENDPOINTS, map(f"{API_URL}/{{}}".format, API_ENDPOINTS)))
     TIMEOUT: int | None = TIMEOUT
+    POOL_SIZE: int = 32  # Max connections per host
+    MEMO_SIZE: int = 1024  # API responses kept in memory. Game info ones can be tens of KB each
+    RETRIES: int = 5
+    READ_RETRIES: int = 1  # Each read timeout costs TIMEOUT seconds, holding a rate limiter slot
+    RETRY_STATUS: set[int] = {429, 500, 502, 503, 504}  # 429: Too many threads
     ISO_TYPES: set[str] = {".iso", ".chd"}
     MEDIA_TYPES: set[str] = {  # TODO: use a (named)2-tuple, namespace or class to hold description (and name)
         "ss",               # In-game screenshot of typical gameplay
@@ -370,6 +774,26 @@ class ScreenScraper:
         "manuel",           # Game manual
     }
     type Systems = dict[int, System]
+    __slots__ = (
+        "dev_id",
+        "dev_password",
+        "software",
+        "username",
+        "password",
+        "cachedir",
+        "_base_params",
+        "_systems",
+        "_systems_by_dir",
+        "_systems_by_suffix",
+        "_cache_index",
+        "_api_call_memo",
+        "_inflight",
+        "_inflight_lock",
+        "_limiter",
+        "_live_limits",
+        "_session",
+        "_crc_cache",
+    )
 
     def __init__(
         self,
@@ -386,8 +810,59 @@ class ScreenScraper:
         self.username = username
         self.password = password
         self.cachedir: pathlib.Path | None = None if cachedir is None else pathlib.Path(cachedir)
+        # Common to all API calls
+        self._base_params = {
+            "devid": self.dev_id,
+            "devpassword": self.dev_password,
+            "softname": self.software,
+            "ssid": self.username,
+            "sspassword": self.password,
+            "output": "json",  # default: "xml"
+        }
         self._systems: ScreenScraper.Systems = {}
         # self._systems: dict[str, System] = {}
+        self._systems_by_dir: dict[str, System] = {}
+        self._systems_by_suffix: dict[str, list[System]] = {}
+        # Load existing cache file names once, so cache misses cost no syscalls
+        self._cache_index: set[str] | None = None
+        if self.cachedir is not None:
+            self._cache_index = CachedResource.scan(self.cachedir)
+        # ROMs don't change between runs, no need to hash them again
+        self._crc_cache: CrcCache | None = None
+        if self.cachedir is not None:
+            self._crc_cache = CrcCache(self.cachedir / "crc32.db")
+        # In-process memoization of API responses, sparing even the cache lookup on repeated calls
+        self._api_call_memo = functools.lru_cache(maxsize=self.MEMO_SIZE)(self._api_call)
+        self._inflight: dict[str, concurrent.futures.Future[t.Any]] = {}
+        self._inflight_lock = threading.Lock()
+        # Conservative until the server tells us the user's actual limits
+        self._limiter = RateLimiter(threads=1)
+        self._live_limits = False  # Set once limits come from a live reply, not from the cache
+        # Single session for all requests: keep-alive connections, no TLS handshake per call
+        retry = requests.adapters.Retry(
+            total=self.RETRIES,
+            read=self.READ_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=self.RETRY_STATUS,
+            raise_on_status=False,  # let raise_for_status() handle it
+        )
+        self._session = requests.Session()
+        # Blocking pool: threads wait for a pooled connection instead of opening
+        # throwaway ones, so every connection is kept alive and reused.
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.POOL_SIZE, pool_block=True, max_retries=retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)  # media URLs are not guaranteed to be HTTPS
+
+    def close(self) -> None:
+        self._session.close()
+        if self._crc_cache is not None:
+            self._crc_cache.close()
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     @property
     def source(self) -> str:
@@ -397,46 +872,88 @@ class ScreenScraper:
     def systems(self) -> Systems:
         if self._systems:
             return self._systems
+        # Build indexes in a single pass, publishing them only when complete
+        systems: ScreenScraper.Systems = {}
+        by_dir: dict[str, System] = {}
+        by_suffix: dict[str, list[System]] = {}
+        debug = log.isEnabledFor(logging.DEBUG)  # Checked once, not for every system
         for system_data in self.api_systems_list():
             system = System(system_data)
             # FIXME: handle "x(a|b),y(c|d)" cases
-            self._systems[system.id] = system
-            log.debug("%r: %s, %s", system, system.paths, system.suffixes)
+            systems[system.id] = system
+            for dirname in system.paths:
+                by_dir.setdefault(dirname, system)
+            for suffix in system.suffixes:
+                by_suffix.setdefault(suffix.lower(), []).append(system)
+            if debug:
+                log.debug("%r: %s, %s", system, system.paths, system.suffixes)
+        self._systems_by_dir = by_dir
+        self._systems_by_suffix = by_suffix
+        self._systems = systems
         return self._systems
 
+    @property
+    def systems_suffixes(self) -> abc.Set[str]:
+        """All ROM file suffixes of all systems, in lowercase"""
+        self.systems  # make sure indexes are loaded
+        return self._systems_by_suffix.keys()
+
     def __str__(self):
         return self.source
 
-    def get_cached_resource(self, endpoint: str, params: dict, filetype=""):
+    def get_cached_resource(self, endpoint: str, params: dict, filetype="") -> CachedResource:
         return CachedResource(
             origin=self.source,
             name=endpoint,
             params=params,
             filetype=filetype,
             rootdir=self.cachedir,
+            index=self._cache_index,
         )
 
     def api_call(self, endpoint: str, **params) -> JsonDict:
-        # Try cached data
+        return self._api_call_memo(endpoint, frozenset(params.items()))
+
+    def _api_call(self, endpoint: str, frozen_params: frozenset[tuple[str, t.Any]]) -> JsonDict:
+        params = dict(frozen_params)
         cache = self.get_cached_resource(endpoint, params, "json")
+        return self._single_flight(cache.stem, self._api_fetch, endpoint, params, cache)
+
+    def _single_flight[R](self, key: str, func: abc.Callable[..., R], *args) -> R:
+        """Call func(*args), or, if a call with the same key is already running, wait for its result.
+
+        Concurrent identical requests then wait for the first one instead of repeating it.
+        """
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if future is None:
+                future = self._inflight[key] = concurrent.futures.Future()
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _api_fetch(self, endpoint: str, params: dict, cache: CachedResource) -> JsonDict:
+        # Try cached data
         if (cache_data := t.cast(ApiData | None, cache.read())) is not None:
-            return cache_data["response"]
+            # Cached replies also carry the user quotas: a fully cached run would
+            # otherwise never raise the limiter, serializing all media downloads.
+            if not self._live_limits:
+                self._update_limits(cache_data["response"])
+            return self._intern_response(cache_data["response"])
         # Fetch data
-        url = "/".join((self.API_URL, endpoint))
-        data = {
-            "devid": self.dev_id,
-            "devpassword": self.dev_password,
-            "softname": self.software,
-            "ssid": self.username,
-            "sspassword": self.password,
-            "output": "json",  # default: "xml"
-        }
-        data.update(params)
-        res: requests.Response
-        try:
-            res = requests.get(url, params=data, timeout=self.TIMEOUT)
-        except requests.exceptions.ReadTimeout as e:
-            raise ScraperError("%s", e, err=e)
+        url = self._ENDPOINT_URLS.get(endpoint) or f"{self.API_URL}/{endpoint}"
+        res = self._get(url, {**self._base_params, **params})
         try:
             res.raise_for_status()
             out = res.json()
@@ -449,9 +966,44 @@ class ScreenScraper:
                 if "identifiants développeur" in msg:  # "Erreur de login : Vérifier vos identifiants développeur !  "
                     raise ScraperResponseError("%s\t%s (Invalid developer credentials)", e, msg, err=e)
             raise ScraperResponseError("%s\n%s\n%s", e, pretty(dict(res.headers)), res.text, err=e)
+        self._update_limits(out["response"])
+        self._live_limits = True
         # Write to cache
         cache.write(out)
-        return out["response"]
+        return self._intern_response(out["response"])
+
+    @staticmethod
+    def _intern_response(response: JsonDict) -> JsonDict:
+        """Intern names and media of games and systems in place, before the reply is shared"""
+        # jeuInfos.php has a single game, jeuRecherche.php and systemesListe.php have lists
+        items = [response["jeu"]] if "jeu" in response else response.get("jeux") or response.get("systemes") or []
+        for item in t.cast(list[dict[str, t.Any]], items):
+            if isinstance(noms := item.get("noms"), dict):  # systems: {"nom_eu": ..., ...}
+                item["noms"] = intern_dict(noms)
+            elif noms:  # games: [{"region": ..., "text": ...}, ...]
+                item["noms"] = [intern_dict(_) for _ in noms]
+            if medias := item.get("medias"):
+                item["medias"] = [intern_dict(_) for _ in medias]
+        return response
+
+    def _get(self, url: str, params: dict | None = None, stream: bool = False) -> requests.Response:
+        """HTTP GET paced by the rate limiter. Transient errors are retried by the session adapter"""
+        try:
+            with self._limiter:
+                return self._session.get(url, params=params, timeout=self.TIMEOUT, stream=stream)
+        # With retries, exhausted timeouts surface as ConnectionError (or RetryError), not Timeout
+        except (requests.Timeout, requests.ConnectionError, requests.exceptions.RetryError) as e:
+            raise ScraperError("%s", e, err=e)
+
+    def _update_limits(self, response: JsonDict) -> None:
+        """Adjust the rate limiter to the user quotas reported by the server"""
+        user = t.cast(dict[str, str], response.get("ssuser") or {})
+        try:
+            threads = int(user.get("maxthreads") or 0)
+            per_minute = int(user.get("maxrequestspermin") or 0)
+        except ValueError:
+            return
+        self._limiter.update(threads=threads, per_minute=per_minute)
 
     # Low-level methods --------------------------------------------------
 
@@ -483,17 +1035,30 @@ class ScreenScraper:
 
     # High-level methods --------------------------------------------------
 
-    def find_system_by_dir(self, path: os.PathLike) -> System | None:
-        # TODO: Make it recursive on parents, so it find systems for roms in subdirs
+    def find_system_by_dir(self, path: os.PathLike, root: os.PathLike | None = None) -> System | None:
+        """System of a ROM directory by its name or, for roms in subdirs, its parents' names.
+
+        If root is given, parents above it are not considered, so an unrelated ancestor
+        such as a mount point or home directory can't capture every unknown directory.
+        """
         if (path := pathlib.Path(path)).is_file():
             path = path.parent
-        dirname: str = path.name
-        for system in self.systems.values():
-            if dirname.lower() in system.paths:
+        top = None if root is None else pathlib.Path(root)
+        self.systems  # make sure indexes are loaded
+        for directory in (path, *path.parents):
+            if system := self._systems_by_dir.get(directory.name.lower()):
                 return system
+            if directory == top:
+                break
         return None
         # raise ScraperError("System not found in %s database for directory: %s", self.source, dirname)
 
+    def find_system_by_suffix(self, path: os.PathLike) -> System | None:
+        """System of a ROM by its file extension, if the extension is exclusive to a single system"""
+        self.systems  # make sure indexes are loaded
+        systems = self._systems_by_suffix.get(pathlib.Path(path).suffix.lower(), [])
+        return systems[0] if len(systems) == 1 else None
+
     def find_game(self, system: System, rom: Rom) -> GameInfoData:
         try:
             info = self.api_game_info(system.id, rom.name, rom.size, rom.crc32)
@@ -508,22 +1073,55 @@ class ScreenScraper:
             raise
         return info
 
-    def download_file(self, url: str, save_path: os.PathLike):
-        # Try cached data
+    def download_file(self, url: str, save_path: os.PathLike) -> None:
         path = pathlib.Path(save_path)
         cache = self.get_cached_resource("download", {"url": url}, path.suffix)
-        log.info("Download file from %s to %s", url, cache.path)
-        # path.parent.mkdir(parents=True, exist_ok=True)
+        if cache.path is None:
+            self._download(url, path, cache)
+            return
+        # Games sharing a media wait for a single download of it, then all copy it from the cache
+        self._single_flight(cache.stem, self._download, url, path, cache)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cache.path, path)
+
+    def _download(self, url: str, path: pathlib.Path, cache: CachedResource) -> None:
+        """Download url to the cache or, without one, straight to path"""
+        # Try cached data
+        if cache.exists():
+            return
+        log.info("Download file from %s to %s", url, cache.path or path)
+        res = self._get(url, stream=True)
+        with res:
+            try:
+                res.raise_for_status()
+            except requests.RequestException as e:
+                raise ScraperResponseError("%s", e, err=e)
+            # Stream from socket to disk, as media such as videos and manuals can be large
+            res.raw.decode_content = True  # transparently gunzip, if compressed
+            if cache.path is None:
+                write_stream(path, res.raw)
+            else:
+                cache.write_stream(res.raw)
 
     @staticmethod
     def _game_name(game: GameInfoData) -> str:
-        for region in unique(itertools.chain(game["rom"]["romregions"].split(","), ("wor", "ss", "eu"))):
-            for name in (_["text"] for _ in game["noms"] if _["region"] == region):
+        names: dict[str, str] = {}
+        for nom in game["noms"]:
+            names.setdefault(nom["region"], nom["text"])  # first name of each region wins
+        rom_regions = map(sys.intern, game["rom"]["romregions"].split(","))
+        for region in unique(itertools.chain(rom_regions, ("wor", "ss", "eu"))):
+            if name := names.get(region):
                 return name
             log.warning("Game from ROM %r missing name in region %r.", game["rom"]["romfilename"], region)
         raise ScraperError("Unknown game region %r", game["rom"]["romregions"])
 
-    def download_rom_media(self, system: System, rom: Rom, save_path: os.PathLike, media_type="mixrbv2") -> bool:
+    def download_rom_media(
+        self,
+        system: System,
+        rom: Rom,
+        save_path: os.PathLike,
+        media_types: str | abc.Collection[str] = ("mixrbv2",),
+    ) -> bool:
         # Anbernic: 282 x 216 mixrbv2
         # https://neoclone.screenscraper.fr/api2/mediaJeu.php?systemeid=4&jeuid=2138&media=mixrbv2(us)
         # Web, non-API: (will keep original aspect ratio)
@@ -531,46 +1129,103 @@ class ScreenScraper:
         # https://www.screenscraper.fr/image.php?plateformid=4&gameid=2138&media=mixrbv2&hd=0&region=us&num=&version=&maxwidth=282&maxheight=216
         # https://www.screenscraper.fr/image.php?plateformid=4&gameid=2138&media=mixrbv2&region=us&maxwidth=320&maxheight=240
         # tiny-scraper: 320, 240
+        if isinstance(media_types, str):  # A single type, not a collection of 1-letter ones
+            media_types = (media_types,)
         game = self.find_game(system, rom)
         assert system.id == int(game["systeme"]["id"])
-        rom_regions = game["rom"]["romregions"].split(",")
+        rom_regions = [sys.intern(_) for _ in game["rom"]["romregions"].split(",")]
         game_name = self._game_name(game)
         # "mediaJeu.php"
         if not game["medias"]:
             log.warning("No media for %r game %r", system.name, game_name)
             return False
-        for media in game["medias"]:
-            if True:
-                return True
-            if media["type"] == media_type and media["region"] in rom_regions:
-                log.info("%r", rom.path.with_suffix(f".{media['format']}").name)
-                path = pathlib.Path(save_path) / rom.path.with_suffix(f".{media['format']}").name
-                self.download_file(media["url"], path)
-                return True
-        else:
-            log.warning("No %r %s media for %s game %s", media_type, rom_regions, system.name, game_name)
+        downloads: dict[str, pathlib.Path] = {}
+        for media_type in media_types:
+            for media in game["medias"]:
+                if media["type"] == media_type and media.get("region") in rom_regions:
+                    name = f"{rom.name}-{media_type}.{media['format']}"
+                    downloads[media["url"]] = pathlib.Path(save_path) / name
+                    break
+            else:
+                log.warning("No %r %s media for %s game %s", media_type, rom_regions, system.name, game_name)
+        if not downloads:
             return False
+        if len(downloads) == 1:
+            # Common case, a single media type: no need for a pool
+            self.download_file(*next(iter(downloads.items())))
+            return True
+        # Fetch all media of this game concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(downloads), MEDIA_JOBS)) as executor:
+            futures = [executor.submit(self.download_file, url, path) for url, path in downloads.items()]
+            for future in futures:
+                future.result()
+        return True
+
+    def _iter_rom_dirs(
+        self, paths: abc.Iterable[os.PathLike]
+    ) -> abc.Iterator[tuple[pathlib.Path, list[pathlib.Path], pathlib.Path]]:
+        """iter_dirs() for ROM files, along with the directory each scan started from"""
+        for item in paths:
+            path = pathlib.Path(item)
+            root = path.parent if path.is_file() else path
+            # Skip files no system would take as ROM, such as saves, images and docs
+            for parent, files in iter_dirs((path,), suffixes=self.systems_suffixes):
+                yield parent, files, root
+
+    def download_media(
+        self,
+        paths: abc.Iterable[os.PathLike],
+        media_types: str | abc.Collection[str] = ("ss",),
+        save_path=".",
+        jobs: int = JOBS,
+        trust_names: bool = False,
+    ):
+        # Pipeline: CRC32 hashing (disk/CPU-bound) runs ahead in its own pool, feeding
+        # the scraping jobs (network-bound), so both disk and network are kept busy.
+        if isinstance(media_types, str):  # A single type, not a collection of 1-letter ones
+            media_types = (media_types,)
+        save_dir = pathlib.Path(save_path)
+
+        def download(hashed: concurrent.futures.Future[str], system: System, rom: Rom) -> bool:
+            hashed.result()
+            return self.download_rom_media(system, rom, save_dir, media_types)
 
-    def download_media(self, paths: abc.Iterable[os.PathLike], media_type="ss", save_path="."):
         num_media = num_rom = 0
         system: System | None = None
-        for path in iter_files(paths, yield_dirs=True):
-            if path.is_dir():
-                log.info("NEW DIR! %s", path)
-                if (system := self.find_system_by_dir(path)) is None:
-                    log.error("System not found in %s database for directory: %s", self.source, path)
-                continue
-            if system is None:
-                continue
-            if path.suffix not in system.suffixes:
-                log.warning("Ignoring non-ROM file for %r: %s", system, path)
-                continue
-            num_rom += 1
+        futures: list[concurrent.futures.Future[bool]] = []
+        with (
+            concurrent.futures.ThreadPoolExecutor(max_workers=HASH_JOBS) as hashers,
+            # No point in more jobs than pooled connections, they would just wait for one
+            concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, self.POOL_SIZE)) as executor,
+        ):
             try:
-                num_media += 1 if self.download_rom_media(system, Rom(path), pathlib.Path(save_path), media_type) else 0
-            except ScraperError as e:
-                log.error(e)
-                continue
+                for parent, files, root in self._iter_rom_dirs(paths):
+                    log.info("NEW DIR! %s", parent)
+                    if (system := self.find_system_by_dir(parent, root)) is None:
+                        log.info("Directory not in %s database, trying by extension: %s", self.source, parent)
+                    dir_roms = num_rom
+                    for path in files:
+                        # Directory not recognized, try by extension
+                        if (rom_system := system or self.find_system_by_suffix(path)) is None:
+                            continue
+                        if path.suffix.lower() not in rom_system.suffixes:
+                            log.warning("Ignoring non-ROM file for %r: %s", rom_system, path)
+                            continue
+                        num_rom += 1
+                        rom = Rom(path, trust_name=trust_names, crc_cache=self._crc_cache)
+                        hashed = hashers.submit(getattr, rom, "crc32")
+                        futures.append(executor.submit(download, hashed, rom_system, rom))
+                    if system is None and num_rom == dir_roms:
+                        log.error("System not found in %s database for directory: %s", self.source, parent)
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        num_media += 1 if future.result() else 0
+                    except ScraperError as e:
+                        log.error(e)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                hashers.shutdown(wait=False, cancel_futures=True)
+                raise
         log.info("%d / %d", num_media, num_rom)
 
     def systems_statistics(self):
@@ -596,12 +1251,14 @@ class ScreenScraper:
             (lambda _: _["suffixes"], "Extensions"),
         )
         log.info("%3d systems in %s database", len(systems), self.source)
+        debug = log.isEnabledFor(logging.DEBUG)
         for criteria, label in stats:
             i = 0
             for system in systems:
                 if not criteria(system):
                     i += 1
-                    log.debug("Missing %s: %r", label, system)
+                    if debug:
+                        log.debug("Missing %s: %r", label, system)
             log.info("%3d missing %s", i, label)
         noms = itertools.chain.from_iterable(_.data["noms"].keys() for _ in systems)
         log.info("Names: %s", set(_.removeprefix("nom_") for _ in noms))
@@ -610,12 +1267,13 @@ class ScreenScraper:
 def cli(argv: list[str] | None = None) -> None:
     """Command-line argument handling and logging setup"""
     args = parse_args(argv)
+    setup_logging(args.loglevel)
     config = read_config(args.config)
-    api = ScreenScraper(**config["ScreenScraper"], cachedir=args.cache_dir)
-    # api.systems_statistics()
-    if args.paths:
-        api.download_media(args.paths)
-        return
+    with ScreenScraper(**config["ScreenScraper"], cachedir=args.cache_dir) as api:
+        # api.systems_statistics()
+        if args.paths:
+            api.download_media(args.paths, jobs=args.jobs, trust_names=args.trust_names)
+            return
 
 
 def run(argv: list[str] | None = None) -> None: